@@ -0,0 +1,45 @@
+"""Numba-compiled numeric kernels for the SMA crossover check"""
+
+try:
+    from numba import njit
+except ImportError:
+    # Fall back to plain Python when numba is not available
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+GOLDEN = 1
+DEATH = -1
+NONE = 0
+
+@njit("int64(float32[::1])", cache=True, nogil=True, fastmath=True)
+def sma_cross(close):
+    """Return GOLDEN/DEATH/NONE for the SMA50/SMA200 cross at the last bar
+
+    Both SMA endpoints are computed in a single pass with running sums:
+    the previous-bar windows are summed once, then the newest close is
+    added and the oldest dropped to get the latest-bar windows.
+
+    close must be a contiguous float32 array. Prices are read as float32
+    to halve memory traffic, but the running sums are float64 so the
+    add/drop updates do not accumulate rounding error.
+    """
+    n = close.shape[0]
+    if n < 201:
+        return NONE
+    s50 = 0.0
+    s200 = 0.0
+    for i in range(n - 201, n - 1):
+        s200 += close[i]
+    for i in range(n - 51, n - 1):
+        s50 += close[i]
+    prev50, prev200 = s50 / 50, s200 / 200
+    s50 += close[n - 1] - close[n - 51]
+    s200 += close[n - 1] - close[n - 201]
+    latest50, latest200 = s50 / 50, s200 / 200
+    if prev50 < prev200 and latest50 > latest200:
+        return GOLDEN
+    if prev50 > prev200 and latest50 < latest200:
+        return DEATH
+    return NONE
@@ -3,60 +3,81 @@ import io
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-import os, json, time
-import yfinance as yf
-import schedule
+import os
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from apscheduler.schedulers.blocking import BlockingScheduler
 import telebot
 from dotenv import load_dotenv
+from core import download_batch, write_json
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
-WATCHLIST = [s.strip() for s in (os.getenv("WATCHLIST") or "").split(",") if s.strip()]
+# Batch downloads key their columns by upper-cased ticker, so normalize the
+# same way core does and drop duplicates before requesting them together
+WATCHLIST = list(dict.fromkeys(s.strip().upper() for s in (os.getenv("WATCHLIST") or "").split(",") if s.strip()))
 
 bot = telebot.TeleBot(BOT_TOKEN)
 SIGNALS_FILE = "signals.json"
 
 try:
-    with open(SIGNALS_FILE, "r") as f:
-        last_signals = json.load(f)
+    with open(SIGNALS_FILE, "rb") as f:
+        last_signals = orjson.loads(f.read())
 except FileNotFoundError:
     last_signals = {}
 
-def get_crossover(symbol, interval, period):
-    df = yf.download(symbol, period=period, interval=interval, progress=False)
-    if df.empty or len(df) < 205:
-        return "None"
-    df["SMA50"] = df["Close"].rolling(50).mean()
-    df["SMA200"] = df["Close"].rolling(200).mean()
-    latest, prev = df.iloc[-1], df.iloc[-2]
-    if prev["SMA50"] < prev["SMA200"] and latest["SMA50"] > latest["SMA200"]:
-        return "Golden Cross"
-    if prev["SMA50"] > prev["SMA200"] and latest["SMA50"] < latest["SMA200"]:
-        return "Death Cross"
-    return "None"
+TIMEFRAMES = ("1d", "1h")
+
+def compute_crossovers(df_all, symbols):
+    # SMA50/SMA200 cross for every symbol at once: a (T, N) array of closes
+    # reduced column-wise, returning (golden, death) boolean masks.
+    if df_all is None or len(df_all) < 205:
+        none = np.zeros(len(symbols), dtype=bool)
+        return none, none
+    close_all = df_all.xs("Close", axis=1, level=1).reindex(columns=symbols)
+    # float32 halves the bytes scanned; the means still accumulate in float64
+    arr = close_all.to_numpy(dtype=np.float32)
+    # Tickers on different calendars leave NaN gaps after alignment; a
+    # stable sort on validity moves them to the top of each column while
+    # keeping the real closes in order at the bottom.
+    valid = ~np.isnan(arr)
+    order = np.argsort(valid, axis=0, kind="stable")
+    arr = np.take_along_axis(arr, order, axis=0)[-201:]
+    enough = valid.sum(axis=0) >= 205
+    lat50, prev50 = arr[-50:].mean(axis=0, dtype=np.float64), arr[-51:-1].mean(axis=0, dtype=np.float64)
+    lat200, prev200 = arr[-200:].mean(axis=0, dtype=np.float64), arr[-201:-1].mean(axis=0, dtype=np.float64)
+    golden = enough & (prev50 < prev200) & (lat50 > lat200)
+    death = enough & (prev50 > prev200) & (lat50 < lat200)
+    return golden, death
 
 def check_signals():
     global last_signals
     messages = []
-    for symbol in WATCHLIST:
-        for tf, period in (("1d", "1y"), ("1h", "60d")):
-            status = get_crossover(symbol, tf, period)
+    # Both timeframes are network-bound, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=len(TIMEFRAMES)) as ex:
+        batches = list(ex.map(lambda tf: download_batch(WATCHLIST, tf), TIMEFRAMES))
+    for tf, df_all in zip(TIMEFRAMES, batches):
+        golden, death = compute_crossovers(df_all, WATCHLIST)
+        for i in np.flatnonzero(golden | death):
+            symbol = WATCHLIST[i]
+            status = "Golden Cross" if golden[i] else "Death Cross"
             prev_status = last_signals.get(symbol, {}).get(tf, "None")
-            if status != prev_status and status != "None":
+            if status != prev_status:
                 emoji = "✅" if status == "Golden Cross" else "❌"
                 messages.append(f"{symbol} ({tf}): {emoji} {status}")
                 last_signals.setdefault(symbol, {})[tf] = status
     if messages:
-        text = "⚡ *Crossover Alert!*\n\n" + "\n".join(messages)
-        bot.send_message(CHAT_ID, text, parse_mode="Markdown")
-        with open(SIGNALS_FILE, "w") as f:
-            json.dump(last_signals, f, indent=2)
+        # Sent as plain text: nothing needs formatting, and symbols with
+        # "_" or "." would otherwise trip Telegram's Markdown parser
+        text = "⚡ Crossover Alert!\n\n" + "\n".join(messages)
+        bot.send_message(CHAT_ID, text)
+        write_json(SIGNALS_FILE, last_signals)
 
-schedule.every().hour.do(check_signals)
-schedule.every().day.at("09:30").do(check_signals)
+sched = BlockingScheduler()
+sched.add_job(check_signals, "cron", minute=0)
+sched.add_job(check_signals, "cron", hour=9, minute=30)
 
 print("[OK] Auto-alert module running...")
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+sched.start()
@@ -5,12 +5,14 @@ Provides both web interface and Telegram bot functionality
 """
 
 import os
-import json
+import time
 import logging
-import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request, jsonify, redirect, url_for
-import yfinance as yf
-import pandas as pd
+from core import (
+    load_watchlist, load_watchlist_entries, save_watchlist, init_watchlist_file, watchlist_lock,
+    get_crossover, get_stock_price, is_cached, download_batch, slice_symbol,
+)
 try:
     import telebot
 except ImportError:
@@ -24,102 +26,43 @@ app = Flask(__name__)
 # Load environment variables
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
-ENV_WATCHLIST = os.getenv("WATCHLIST", "")
 PORT = int(os.getenv("PORT", 5000))
+MAX_WORKERS = 16
 
 # Initialize bot if token is available (disabled for web-only deployment)
 bot = None
 # Temporarily disabled to avoid conflicts
 # if BOT_TOKEN and telebot:
-#     bot = telebot.TeleBot(BOT_TOKEN)
-
-WATCHLIST_FILE = "watchlist.json"
-
-def load_watchlist():
-    """Load watchlist from file or environment"""
-    if os.path.exists(WATCHLIST_FILE):
-        try:
-            with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, list):
-                return [s.strip().upper() for s in data if s.strip()]
-        except Exception as e:
-            logging.error("Failed to load watchlist.json: %s", e)
-    
-    if ENV_WATCHLIST:
-        return [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
-    return []
-
-def save_watchlist(lst):
-    """Save watchlist to file"""
-    try:
-        with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
-            json.dump(lst, f, indent=2)
-        return True
-    except Exception as e:
-        logging.error("Failed to save watchlist.json: %s", e)
-        return False
-
-def get_crossover(symbol, interval="1d"):
-    """Check for SMA crossover signals"""
-    try:
-        period = "1y" if interval == "1d" else "60d"
-        df = yf.download(symbol, period=period, interval=interval, progress=False, auto_adjust=True)
-        
-        if df is None or df.empty:
-            return "No data"
-        
-        df["SMA50"] = df["Close"].rolling(50).mean()
-        df["SMA200"] = df["Close"].rolling(200).mean()
-        df = df.dropna(subset=["SMA50", "SMA200"])
-        
-        if len(df) < 2:
-            return "Not enough data"
-        
-        prev = df.iloc[-2]
-        latest = df.iloc[-1]
-        prev50, prev200 = float(prev["SMA50"]), float(prev["SMA200"])
-        latest50, latest200 = float(latest["SMA50"]), float(latest["SMA200"])
-        
-        if prev50 < prev200 and latest50 > latest200:
-            return "Golden Cross"
-        if prev50 > prev200 and latest50 < latest200:
-            return "Death Cross"
-        return "No Crossover"
-    except Exception as e:
-        logging.warning("get_crossover error for %s: %s", symbol, e)
-        return "Error"
-
-def get_stock_price(symbol):
-    """Get latest stock price"""
-    try:
-        stock = yf.Ticker(symbol)
-        data = stock.history(period="1d")
-        if data.empty:
-            return None
-        return float(data["Close"].iloc[-1])
-    except Exception as e:
-        logging.error("Error getting price for %s: %s", symbol, e)
-        return None
+#     bot = telebot.TeleBot(BOT_TOKEN, num_threads=8)
 
 # Web Routes
 @app.route('/')
 def index():
     """Main dashboard"""
     watchlist = load_watchlist()
-    watchlist_data = []
     
-    for symbol in watchlist:
-        price = get_stock_price(symbol)
-        daily_signal = get_crossover(symbol, "1d")
-        hourly_signal = get_crossover(symbol, "1h")
-        
-        watchlist_data.append({
+    # Both batch downloads are network-bound, so run them concurrently.
+    # Only symbols whose signal or price is not cached are downloaded, and
+    # their latest price comes from the daily bars.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        daily_future = ex.submit(download_batch, [s for s in watchlist if not is_cached(s, "1d")], "1d")
+        hourly_future = ex.submit(download_batch, [s for s in watchlist if not is_cached(s, "1h")], "1h")
+        daily_all, hourly_all = daily_future.result(), hourly_future.result()
+    
+    def build_row(symbol):
+        daily_signal, price = get_crossover(symbol, "1d", df=slice_symbol(daily_all, symbol))
+        hourly_signal, _ = get_crossover(symbol, "1h", df=slice_symbol(hourly_all, symbol))
+        return {
             'symbol': symbol,
             'price': price,
             'daily_signal': daily_signal,
             'hourly_signal': hourly_signal
-        })
+        }
+    
+    # Symbols missing from a failed batch fall back to their own fetches,
+    # which are again network-bound, so build the rows in parallel
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        watchlist_data = list(ex.map(build_row, watchlist))
     
     return render_template('index.html', watchlist=watchlist_data)
 
@@ -130,12 +73,14 @@ def add_stock():
     if not symbol:
         return jsonify({'error': 'Symbol is required'}), 400
     
-    watchlist = load_watchlist()
-    if symbol in watchlist:
+    with watchlist_lock:
+        watchlist, watchlist_set = load_watchlist_entries()
+        exists = symbol in watchlist_set
+        saved = not exists and save_watchlist(watchlist + [symbol])
+    if exists:
         return jsonify({'error': f'{symbol} is already in watchlist'}), 400
     
-    watchlist.append(symbol)
-    if save_watchlist(watchlist):
+    if saved:
         return jsonify({'success': f'Added {symbol} to watchlist'})
     else:
         return jsonify({'error': 'Failed to save watchlist'}), 500
@@ -147,12 +92,14 @@ def remove_stock():
     if not symbol:
         return jsonify({'error': 'Symbol is required'}), 400
     
-    watchlist = load_watchlist()
-    if symbol not in watchlist:
+    with watchlist_lock:
+        watchlist, watchlist_set = load_watchlist_entries()
+        missing = symbol not in watchlist_set
+        saved = not missing and save_watchlist([s for s in watchlist if s != symbol])
+    if missing:
         return jsonify({'error': f'{symbol} not found in watchlist'}), 400
     
-    watchlist = [s for s in watchlist if s != symbol]
-    if save_watchlist(watchlist):
+    if saved:
         return jsonify({'success': f'Removed {symbol} from watchlist'})
     else:
         return jsonify({'error': 'Failed to save watchlist'}), 500
@@ -161,9 +108,8 @@ def remove_stock():
 def get_signal(symbol):
     """API endpoint to get signal for a specific symbol"""
     symbol = symbol.upper()
-    daily = get_crossover(symbol, "1d")
-    hourly = get_crossover(symbol, "1h")
-    price = get_stock_price(symbol)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        (daily, price), (hourly, _) = ex.map(lambda tf: get_crossover(symbol, tf), ("1d", "1h"))
     
     return jsonify({
         'symbol': symbol,
@@ -223,13 +169,15 @@ if bot:
             return
         
         sym = parts[1].strip().upper()
-        wl = load_watchlist()
-        if sym in wl:
+        with watchlist_lock:
+            wl, wl_set = load_watchlist_entries()
+            exists = sym in wl_set
+            saved = not exists and save_watchlist(wl + [sym])
+        if exists:
             bot.reply_to(msg, f"{sym} is already in watchlist.")
             return
         
-        wl.append(sym)
-        if save_watchlist(wl):
+        if saved:
             bot.reply_to(msg, f"Added {sym} to watchlist.")
         else:
             bot.reply_to(msg, f"Failed to add {sym} — check logs")
@@ -242,13 +190,15 @@ if bot:
             return
         
         sym = parts[1].strip().upper()
-        wl = load_watchlist()
-        if sym not in wl:
+        with watchlist_lock:
+            wl, wl_set = load_watchlist_entries()
+            missing = sym not in wl_set
+            saved = not missing and save_watchlist([s for s in wl if s != sym])
+        if missing:
             bot.reply_to(msg, f"{sym} not found in watchlist.")
             return
         
-        wl = [s for s in wl if s != sym]
-        if save_watchlist(wl):
+        if saved:
             bot.reply_to(msg, f"Removed {sym} from watchlist.")
         else:
             bot.reply_to(msg, f"Failed to remove {sym} — check logs")
@@ -276,8 +226,8 @@ if bot:
         
         sym = parts[1].strip().upper()
         bot.reply_to(msg, f"Checking {sym}... (may take a few seconds)")
-        daily = get_crossover(sym, interval="1d")
-        hourly = get_crossover(sym, interval="1h")
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            (daily, _), (hourly, _) = ex.map(lambda tf: get_crossover(sym, interval=tf), ("1d", "1h"))
         text = f"{sym}\nDaily: {daily}\nHourly: {hourly}"
         bot.send_message(msg.chat.id, text)
 
@@ -293,19 +243,11 @@ def start_telegram_bot():
             bot.infinity_polling(timeout=10, long_polling_timeout=5)
         except Exception as e:
             logging.exception("Error in Telegram bot: %s", e)
-            import time
             time.sleep(5)
 
 if __name__ == "__main__":
     # Initialize watchlist file if it doesn't exist
-    if not os.path.exists(WATCHLIST_FILE):
-        initial = [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
-        try:
-            with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
-                json.dump(initial, f, indent=2)
-            logging.info("Created initial watchlist.json")
-        except Exception as ex:
-            logging.error("Failed creating watchlist.json: %s", ex)
+    init_watchlist_file()
     
     # Skip Telegram bot for web-only deployment
     logging.info("Telegram bot disabled for web-only deployment")
@@ -1,11 +1,13 @@
 ﻿# bot.py — Tele-Crossover Bot (Railway-ready)
 import os
-import json
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import telebot
-import yfinance as yf
-import pandas as pd
+from core import (
+    load_watchlist, load_watchlist_entries, save_watchlist, init_watchlist_file, watchlist_lock,
+    get_crossover, get_stock_price,
+)
 
 # ---- logging ----
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,67 +15,18 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # ---- load environment variables from Railway ----
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
-ENV_WATCHLIST = os.getenv("WATCHLIST", "")
 
 if not BOT_TOKEN or not CHAT_ID:
     logging.error("BOT_TOKEN or CHAT_ID not set in environment variables!")
     raise SystemExit(1)
 
-bot = telebot.TeleBot(BOT_TOKEN)
-
-# ---- watchlist file ----
-WATCHLIST_FILE = "watchlist.json"
-
-def load_watchlist():
-    if os.path.exists(WATCHLIST_FILE):
-        try:
-            with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, list):
-                return [s.strip().upper() for s in data if s.strip()]
-        except Exception as e:
-            logging.error("Failed to load watchlist.json: %s", e)
-    if ENV_WATCHLIST:
-        return [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
-    return []
-
-def save_watchlist(lst):
-    try:
-        with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
-            json.dump(lst, f, indent=2)
-        return True
-    except Exception as e:
-        logging.error("Failed to save watchlist.json: %s", e)
-        return False
+# handlers run on a worker pool so a slow /signal fetch does not block
+# other commands
+bot = telebot.TeleBot(BOT_TOKEN, num_threads=8)
 
 def norm(sym):
     return sym.strip().upper()
 
-# ---- SMA crossover ----
-def get_crossover(symbol, interval="1d"):
-    try:
-        period = "1y" if interval=="1d" else "60d"
-        df = yf.download(symbol, period=period, interval=interval, progress=False, auto_adjust=True)
-        if df is None or df.empty:
-            return "No data"
-        df["SMA50"] = df["Close"].rolling(50).mean()
-        df["SMA200"] = df["Close"].rolling(200).mean()
-        df = df.dropna(subset=["SMA50","SMA200"])
-        if len(df) < 2:
-            return "Not enough data"
-        prev = df.iloc[-2]
-        latest = df.iloc[-1]
-        prev50, prev200 = float(prev["SMA50"]), float(prev["SMA200"])
-        latest50, latest200 = float(latest["SMA50"]), float(latest["SMA200"])
-        if prev50 < prev200 and latest50 > latest200:
-            return "Golden Cross"
-        if prev50 > prev200 and latest50 < latest200:
-            return "Death Cross"
-        return "No Crossover"
-    except Exception as e:
-        logging.warning("get_crossover error for %s: %s", symbol, e)
-        return "Error"
-
 # ---- Commands ----
 @bot.message_handler(commands=["start"])
 def handle_start(msg):
@@ -107,12 +60,14 @@ def handle_add(msg):
         bot.reply_to(msg, "Usage: /addstock SYMBOL")
         return
     sym = norm(parts[1])
-    wl = load_watchlist()
-    if sym in wl:
+    with watchlist_lock:
+        wl, wl_set = load_watchlist_entries()
+        exists = sym in wl_set
+        saved = not exists and save_watchlist(wl + [sym])
+    if exists:
         bot.reply_to(msg, f"{sym} is already in watchlist.")
         return
-    wl.append(sym)
-    if save_watchlist(wl):
+    if saved:
         bot.reply_to(msg, f"Added {sym} to watchlist.")
     else:
         bot.reply_to(msg, f"Failed to add {sym} — check logs")
@@ -124,12 +79,14 @@ def handle_remove(msg):
         bot.reply_to(msg, "Usage: /removestock SYMBOL")
         return
     sym = norm(parts[1])
-    wl = load_watchlist()
-    if sym not in wl:
+    with watchlist_lock:
+        wl, wl_set = load_watchlist_entries()
+        missing = sym not in wl_set
+        saved = not missing and save_watchlist([s for s in wl if s!=sym])
+    if missing:
         bot.reply_to(msg, f"{sym} not found in watchlist.")
         return
-    wl = [s for s in wl if s!=sym]
-    if save_watchlist(wl):
+    if saved:
         bot.reply_to(msg, f"Removed {sym} from watchlist.")
     else:
         bot.reply_to(msg, f"Failed to remove {sym} — check logs")
@@ -141,12 +98,10 @@ def handle_price(msg):
         bot.reply_to(msg, "Usage: /price SYMBOL")
         return
     ticker = parts[1].upper()
-    stock = yf.Ticker(ticker)
-    data = stock.history(period="1d")
-    if data.empty:
+    price = get_stock_price(ticker)
+    if price is None:
         bot.reply_to(msg, f"❌ Could not fetch data for {ticker}")
     else:
-        price = data["Close"].iloc[-1]
         bot.reply_to(msg, f"💹 {ticker} latest closing price: ₹{price:.2f}")
 
 @bot.message_handler(commands=["signal"])
@@ -157,8 +112,8 @@ def handle_signal(msg):
         return
     sym = norm(parts[1])
     bot.reply_to(msg, f"Checking {sym}... (may take a few seconds)")
-    daily = get_crossover(sym, interval="1d")
-    hourly = get_crossover(sym, interval="1h")
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        (daily, _), (hourly, _) = ex.map(lambda tf: get_crossover(sym, interval=tf), ("1d", "1h"))
     text = f"{sym}\nDaily: {daily}\nHourly: {hourly}"
     bot.send_message(msg.chat.id, text)
 
@@ -177,12 +132,5 @@ def start_bot():
 
 if __name__=="__main__":
     # Ensure watchlist file exists
-    if not os.path.exists(WATCHLIST_FILE):
-        initial = [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
-        try:
-            with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
-                json.dump(initial, f, indent=2)
-            logging.info("Created initial watchlist.json")
-        except Exception as ex:
-            logging.error("Failed creating watchlist.json: %s", ex)
+    init_watchlist_file()
     start_bot()
@@ -0,0 +1,359 @@
+"""
+Shared core of Tele-Crossover Bot
+Watchlist storage, market data fetching and SMA crossover detection used
+by the web app, the Telegram bot and the alerts job
+"""
+
+import os
+import time
+import logging
+import threading
+from urllib.parse import quote
+from collections import Counter
+import yfinance as yf
+from curl_cffi import requests as curl_requests
+from curl_cffi.requests.exceptions import RequestException
+from yfinance.exceptions import YFRateLimitError, YFTzMissingError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+import orjson
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+from _kernels import sma_cross, GOLDEN, DEATH
+
+ENV_WATCHLIST = os.getenv("WATCHLIST", "")
+
+# Shared keep-alive session for every yfinance call so repeated requests
+# reuse pooled TLS connections. Recent yfinance releases only accept
+# curl_cffi sessions.
+SESSION = curl_requests.Session(impersonate="chrome")
+# Let fetch failures surface as exceptions instead of empty frames, so they
+# can be retried and counted by the circuit breaker
+yf.config.debug.hide_exceptions = False
+
+WATCHLIST_FILE = "watchlist.json"
+CACHE_DIR = "cache"
+# Bars kept per symbol on disk; comfortably more than the SMA200 window
+CACHE_ROWS = 400
+
+# In-process result caches: daily SMAs move at most once a day, hourly
+# signals and prices are refreshed every 15 minutes.
+_signal_caches = {
+    "1d": TTLCache(maxsize=1024, ttl=6 * 3600),
+    "1h": TTLCache(maxsize=1024, ttl=15 * 60),
+}
+_price_cache = TTLCache(maxsize=1024, ttl=15 * 60)
+_cache_lock = threading.Lock()
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        return cache.get(key)
+
+def _cache_put(cache, key, value):
+    with _cache_lock:
+        cache[key] = value
+
+def _signal_cache(interval):
+    return _signal_caches.get(interval, _signal_caches["1h"])
+
+# Per-symbol circuit breaker: after BREAKER_FAILURES consecutive failed
+# fetches a symbol is skipped for BREAKER_COOLDOWN seconds
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 5 * 60
+_failures = Counter()
+_blocked_until = {}
+_breaker_lock = threading.Lock()
+
+def _breaker_open(symbol):
+    with _breaker_lock:
+        return time.time() < _blocked_until.get(symbol, 0)
+
+def _record_failure(symbol):
+    with _breaker_lock:
+        _failures[symbol] += 1
+        if _failures[symbol] >= BREAKER_FAILURES:
+            _blocked_until[symbol] = time.time() + BREAKER_COOLDOWN
+            del _failures[symbol]
+
+def _record_success(symbol):
+    with _breaker_lock:
+        _failures.pop(symbol, None)
+        _blocked_until.pop(symbol, None)
+
+# Parsed watchlist, its membership set and the file identity it was read at
+_wl_cache = (None, frozenset(), None)
+# Held by save_watchlist; callers doing load-modify-save hold it around the
+# whole sequence so concurrent handler threads cannot drop each other's
+# edits. It is per-process, which is why the web app runs a single
+# gunicorn worker with many threads rather than several workers.
+watchlist_lock = threading.RLock()
+
+def _file_key(st):
+    # mtime alone can repeat on filesystems with coarse timestamps; an atomic
+    # replace always brings a new inode, and edits usually change the size
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def write_json(path, obj):
+    """Serialize obj with orjson, atomically replace path and return its file key"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    # A rename keeps the inode, so this is the key readers will see
+    key = _file_key(os.stat(tmp))
+    os.replace(tmp, path)
+    return key
+
+def load_watchlist_entries():
+    """Load watchlist as a (list, frozenset) pair for ordered display and O(1) lookups"""
+    global _wl_cache
+    if os.path.exists(WATCHLIST_FILE):
+        try:
+            key = _file_key(os.stat(WATCHLIST_FILE))
+            cached, cached_set, cached_key = _wl_cache
+            if cached is not None and key == cached_key:
+                return list(cached), cached_set
+            with open(WATCHLIST_FILE, "rb") as f:
+                data = orjson.loads(f.read())
+            if isinstance(data, list):
+                wl = [s.strip().upper() for s in data if s.strip()]
+                _wl_cache = (wl, frozenset(wl), key)
+                return list(wl), _wl_cache[1]
+        except Exception as e:
+            logging.error("Failed to load watchlist.json: %s", e)
+    
+    if ENV_WATCHLIST:
+        wl = [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
+        return wl, frozenset(wl)
+    return [], frozenset()
+
+def load_watchlist():
+    """Load watchlist from file or environment"""
+    return load_watchlist_entries()[0]
+
+def save_watchlist(lst):
+    """Save watchlist to file"""
+    global _wl_cache
+    try:
+        wl = [s.strip().upper() for s in lst if s.strip()]
+        with watchlist_lock:
+            key = write_json(WATCHLIST_FILE, wl)
+            _wl_cache = (wl, frozenset(wl), key)
+        return True
+    except Exception as e:
+        logging.error("Failed to save watchlist.json: %s", e)
+        return False
+
+def compute_crossover(df):
+    """Classify the SMA50/SMA200 crossover on an already-downloaded frame
+    
+    Returns a (signal, last_close) tuple; last_close is None when the
+    frame has no usable closes.
+    """
+    if df is None or df.empty:
+        return "No data", None
+    
+    # Only the SMA endpoints at the last two bars matter, so hand the raw
+    # Close array to the compiled kernel instead of building rolling windows
+    close = df["Close"].to_numpy(dtype=np.float32).ravel()
+    close = np.ascontiguousarray(close[~np.isnan(close)])
+    if close.size == 0:
+        return "No data", None
+    last_close = float(close[-1])
+    if close.size < 201:
+        return "Not enough data", last_close
+    
+    cross = sma_cross(close)
+    if cross == GOLDEN:
+        return "Golden Cross", last_close
+    if cross == DEATH:
+        return "Death Cross", last_close
+    return "No Crossover", last_close
+
+def _close_frame(df):
+    """Reduce a yfinance download to a single float Close column"""
+    close = df["Close"]
+    if isinstance(close, pd.DataFrame):
+        # Single-ticker downloads may still carry a ticker column level
+        close = close.iloc[:, 0]
+    return close.astype("float64").dropna().to_frame("Close")
+
+_TRANSIENT_ERRORS = (RequestException, YFRateLimitError)
+
+def _history(symbol, interval, **kwargs):
+    return yf.Ticker(symbol, session=SESSION).history(
+        interval=interval, auto_adjust=True, **kwargs)
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(1, 10),
+       retry=retry_if_exception_type(_TRANSIENT_ERRORS), reraise=True)
+def _fetch_bars(symbol, interval, **kwargs):
+    """Download bars for one symbol, retrying transient network failures"""
+    return _history(symbol, interval, **kwargs)
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(1, 10),
+       retry=retry_if_exception_type(_TRANSIENT_ERRORS + (YFTzMissingError,)), reraise=True)
+def _fetch_tail(symbol, interval, start):
+    """Download bars from start onwards, retrying transient network failures"""
+    # A start date needs the exchange timezone first, and yfinance reports a
+    # failed timezone lookup, network errors included, as YFTzMissingError
+    return _history(symbol, interval, start=start)
+
+def _has_corporate_action(df):
+    """Whether a fetched range contains a stock split or dividend"""
+    for column in ("Stock Splits", "Dividends"):
+        if column in df.columns and (df[column].fillna(0) != 0).any():
+            return True
+    return False
+
+def load_history(symbol, interval="1d"):
+    """Load Close history, downloading only bars newer than the on-disk cache"""
+    # Symbols are user input; percent-encode them so characters such as
+    # "/" cannot escape CACHE_DIR while tickers like M&M.NS still work
+    path = os.path.join(CACHE_DIR, f"{quote(symbol, safe='')}_{interval}.parquet")
+    cached = None
+    if os.path.exists(path):
+        try:
+            cached = pd.read_parquet(path, engine="pyarrow")
+        except Exception as e:
+            logging.warning("Failed to read %s: %s", path, e)
+    
+    period = "1y" if interval == "1d" else "60d"
+    try:
+        if cached is None or cached.empty:
+            df = _fetch_bars(symbol, interval, period=period)
+        else:
+            # Re-fetch the last cached bar too, it may have been incomplete
+            try:
+                df = _fetch_tail(symbol, interval, cached.index[-1])
+            except Exception as e:
+                # Serve the stale cache rather than an error; the failure
+                # still counts towards the circuit breaker
+                logging.warning("Failed to update %s %s history: %s", symbol, interval, e)
+                _record_failure(symbol)
+                return cached
+            if df is not None and not df.empty and _has_corporate_action(df):
+                # auto_adjust rescales every earlier close after a split or
+                # dividend, so the cached bars no longer line up with the new
+                # ones; drop them and fetch the full adjusted period again
+                cached = None
+                df = _fetch_bars(symbol, interval, period=period)
+    except Exception:
+        _record_failure(symbol)
+        raise
+    _record_success(symbol)
+    
+    if df is None or df.empty:
+        return cached
+    
+    history = _close_frame(df)
+    if cached is not None and not cached.empty:
+        history = pd.concat([cached, history])
+        history = history[~history.index.duplicated(keep="last")]
+    history = history.tail(CACHE_ROWS)
+    
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        history.to_parquet(tmp, engine="pyarrow")
+        os.replace(tmp, path)
+    except Exception as e:
+        logging.warning("Failed to write %s: %s", path, e)
+    return history
+
+def get_crossover(symbol, interval="1d", df=None):
+    """Check for SMA crossover signals
+    
+    Returns a (signal, price) tuple. Signals and prices are cached
+    separately with their own TTLs; for the daily interval the price is
+    the latest close, taken from the daily bars when they are fetched and
+    refreshed from df, or on its own without it, when only the price has
+    expired. Other intervals return whatever price is cached, without
+    fetching one.
+    """
+    cache = _signal_cache(interval)
+    key = (symbol, interval)
+    signal = _cache_get(cache, key)
+    if signal is not None:
+        price = _cache_get(_price_cache, symbol)
+        if interval == "1d" and price is None:
+            if df is not None:
+                closes = df["Close"].dropna()
+                if not closes.empty:
+                    price = float(closes.iloc[-1])
+                    _cache_put(_price_cache, symbol, price)
+            else:
+                price = get_stock_price(symbol)
+        return signal, price
+    try:
+        if df is None:
+            if _breaker_open(symbol):
+                return "Error", None
+            df = load_history(symbol, interval)
+        signal, last_close = compute_crossover(df)
+    except Exception as e:
+        logging.warning("get_crossover error for %s: %s", symbol, e)
+        return "Error", None
+    _cache_put(cache, key, signal)
+    if interval == "1d" and last_close is not None:
+        _cache_put(_price_cache, symbol, last_close)
+        return signal, last_close
+    return signal, _cache_get(_price_cache, symbol)
+
+def is_cached(symbol, interval="1d"):
+    """Whether get_crossover can answer for symbol/interval without new bars"""
+    if _cache_get(_signal_cache(interval), (symbol, interval)) is None:
+        return False
+    # Daily rows also show the latest close, which expires before the signal
+    return interval != "1d" or _cache_get(_price_cache, symbol) is not None
+
+def download_batch(symbols, interval="1d"):
+    """Download bars for several symbols in a single request"""
+    if not symbols:
+        return None
+    try:
+        period = "1y" if interval == "1d" else "60d"
+        return yf.download(symbols, period=period, interval=interval, group_by="ticker",
+                           threads=True, progress=False, session=SESSION, auto_adjust=True)
+    except Exception as e:
+        logging.warning("download_batch error for %s: %s", interval, e)
+        return None
+
+def slice_symbol(df_all, symbol):
+    """Extract one symbol's bars from a batch download"""
+    if df_all is None or df_all.empty or symbol not in df_all.columns.get_level_values(0):
+        return None
+    df = df_all[symbol]
+    # yf.download reports a failed ticker as an all-NaN column; return None
+    # so get_crossover falls back to the retried, breaker-guarded fetch
+    if "Close" not in df.columns or df["Close"].isna().all():
+        return None
+    # Rows where this symbol did not trade are NaN after alignment; they are
+    # dropped from the Close array in compute_crossover rather than here
+    return df
+
+def get_stock_price(symbol):
+    """Get latest stock price"""
+    cached = _cache_get(_price_cache, symbol)
+    if cached is not None:
+        return cached
+    try:
+        stock = yf.Ticker(symbol, session=SESSION)
+        data = stock.history(period="1d")
+        if data.empty:
+            return None
+        price = float(data["Close"].iloc[-1])
+    except Exception as e:
+        logging.error("Error getting price for %s: %s", symbol, e)
+        return None
+    _cache_put(_price_cache, symbol, price)
+    return price
+
+def init_watchlist_file():
+    """Create watchlist.json from the WATCHLIST environment variable if missing"""
+    if os.path.exists(WATCHLIST_FILE):
+        return
+    initial = [s.strip().upper() for s in ENV_WATCHLIST.split(",") if s.strip()]
+    try:
+        write_json(WATCHLIST_FILE, initial)
+        logging.info("Created initial watchlist.json")
+    except Exception as ex:
+        logging.error("Failed creating watchlist.json: %s", ex)